@@ -10,98 +10,242 @@ Users can filter by country and year range, analyze explosion magnitude and dept
 view an interactive map of test sites.
 """
 
+import io
+import os
+from pathlib import Path
+
 import streamlit as st
 import pandas as pd
+import numpy as np
 import pydeck as pdk
 import matplotlib.pyplot as plt
-import seaborn as sns
+from scipy.stats import gaussian_kde
 from PIL import Image
 
 # ---- Page Setup ----
 st.set_page_config(page_title="Nuclear Explosions Explorer", layout="wide")
 
+CSV_PATH = Path("nuclear_explosions.csv")
+# Bump whenever clean_csv, USECOLS, DTYPES or the rename map change, so stale caches are not read
+PARQUET_SCHEMA_VERSION = 1
+PARQUET_PATH = Path(f"nuclear_explosions.v{PARQUET_SCHEMA_VERSION}.parquet")
+
+# Caches keyed on user input (free-text search, slider ranges) are bounded so memory can't grow unchecked
+CACHE_MAX_ENTRIES = 64
+
+MAP_POINT_LIMIT = 5000
+DEPTH_BINS = 30
+KDE_MIN_POINTS = 200
+# Columns the app reads from the CSV and the types they are parsed into
+USECOLS = [
+    "Location.Cordinates.Latitude",
+    "Location.Cordinates.Longitude",
+    "Date.Day",
+    "Date.Month",
+    "Date.Year",
+    "WEAPON SOURCE COUNTRY",
+    "WEAPON DEPLOYMENT LOCATION",
+    "Location.Cordinates.Depth",
+    "Data.Purpose",
+    "Data.Name",
+    "Data.Type"
+]
+DTYPES = {
+    "Location.Cordinates.Latitude": "float64",
+    "Location.Cordinates.Longitude": "float64",
+    "Location.Cordinates.Depth": "float64",
+    "Date.Day": "int8",
+    "Date.Month": "int8",
+    "Date.Year": "int16",
+    "WEAPON SOURCE COUNTRY": "category",
+    "WEAPON DEPLOYMENT LOCATION": "object",
+    "Data.Purpose": "category",
+    "Data.Name": "object",
+    "Data.Type": "category"
+}
+# Only the columns the map layers and tooltip read get serialized to the browser
+MAP_COLUMNS = ["Longitude", "Latitude", "Country", "Location", "Year", "Depth", "Test Type"]
+SCATTER_TOOLTIP = {"text": "{Country}\n{Location}\nYear: {Year}\nDepth: {Depth}\nCategory: {Test Type}"}
+HEXAGON_TOOLTIP = {"text": "{elevationValue} explosions"}
+
+def clean_csv():
+    # Reads the raw CSV into the cleaned, typed, year-sorted frame that gets cached as Parquet
+    df = pd.read_csv(CSV_PATH, usecols=USECOLS, dtype=DTYPES, engine="pyarrow")
+
+    df = df.dropna(subset=USECOLS)
+
+    df = df.rename(columns={
+        "Location.Cordinates.Latitude": "Latitude",
+        "Location.Cordinates.Longitude": "Longitude",
+        "Date.Year": "Year",
+        "WEAPON SOURCE COUNTRY": "Country",
+        "Location.Cordinates.Depth": "Depth",
+        "Data.Purpose": "Purpose",
+        "Data.Name": "Test Name",
+        "Data.Type": "Test Type"
+    })
+    df["Location"] = df["WEAPON DEPLOYMENT LOCATION"] + ", " + df["Country"].astype(str)
+
+    # Keeping rows in year order lets the year filter become a binary search
+    return df.sort_values("Year", kind="stable").reset_index(drop=True)
+
+def write_parquet(df):
+    # Write to a temp file and swap it in, so an interrupted write never leaves a partial cache
+    tmp_path = PARQUET_PATH.with_name(f"{PARQUET_PATH.name}.{os.getpid()}.tmp")
+    try:
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, PARQUET_PATH)
+    except OSError:
+        # Read-only deployments still work, they just parse the CSV on each cold start
+        tmp_path.unlink(missing_ok=True)
+
+def parquet_is_current():
+    if not PARQUET_PATH.exists():
+        return False
+    # A Parquet file converted offline may be deployed without its CSV
+    if not CSV_PATH.exists():
+        return True
+    return PARQUET_PATH.stat().st_mtime >= CSV_PATH.stat().st_mtime
+
 @st.cache_data
 def load_data():
     try:
-        df = pd.read_csv("nuclear_explosions.csv")
-
-        df = df.dropna(subset=[
-            "Location.Cordinates.Latitude",
-            "Location.Cordinates.Longitude",
-            "Date.Day",
-            "Date.Month",
-            "Date.Year",
-            "WEAPON SOURCE COUNTRY",
-            "WEAPON DEPLOYMENT LOCATION",
-            "Location.Cordinates.Depth",
-            "Data.Purpose",
-            "Data.Name",
-            "Data.Type"
-        ])
-
-        df["Latitude"] = df["Location.Cordinates.Latitude"]
-        df["Longitude"] = df["Location.Cordinates.Longitude"]
-        df["Year"] = df["Date.Year"]
-        df["Country"] = df["WEAPON SOURCE COUNTRY"]
-        df["Depth"] = df["Location.Cordinates.Depth"]
-        df["Location"] = df["WEAPON DEPLOYMENT LOCATION"] + ", " + df["Country"]
-        df["Purpose"] = df["Data.Purpose"]
-        df["Test Name"] = df["Data.Name"]
-        df["Test Type"] = df["Data.Type"]
-        df["Category"] = df["Test Type"]
-
-        return df
+        # Parquet keeps the cleaned column names, dtypes (categoricals included) and row order,
+        # so it is only rebuilt from the CSV when missing, stale or unreadable
+        df = None
+        if parquet_is_current():
+            try:
+                df = pd.read_parquet(PARQUET_PATH)
+            except (OSError, ValueError):
+                # A damaged cache file is rebuilt below rather than breaking every start
+                df = None
+        if df is None:
+            df = clean_csv()
+            write_parquet(df)
+
+        # Small pre-aggregated tables so summaries can be sliced instead of recomputed from rows
+        agg = {
+            "year_x_country": df.groupby(["Country", "Year"], observed=True).size().unstack(fill_value=0)
+        }
+
+        # Sidebar options read straight off the categorical dictionaries
+        country_list = df["Country"].cat.categories.tolist()
+        category_list = ["All"] + df["Test Type"].cat.categories.sort_values().tolist()
+
+        return df, agg, country_list, category_list
     except Exception as e:
         st.error(f"Error loading data: {e}")
-        return pd.DataFrame()
+        return pd.DataFrame(), {}, [], ["All"]
 
-image = Image.open("banner.png")
+@st.cache_resource
+def get_banner():
+    # Decode once up front so the cached image no longer holds the file open
+    image = Image.open("banner.png")
+    image.load()
+    return image
+
+image = get_banner()
 st.image(image, use_container_width=True)
 
 st.title("Nuclear Explosions Explorer")
 st.markdown("Welcome to Khoa Pham's Nuclear Explosion Research App. Explore historical nuclear test data by country, depth, purpose, and type.")
 
-data = load_data()
+data, agg, country_list, category_list = load_data()
 
 # ---- Navigation ----
 section = st.sidebar.radio("Navigate", ["Overview", "Charts", "Map", "Details", "Feedback"])
 
 # ---- Filters ----
 st.sidebar.title("Filters")
-countries = st.sidebar.multiselect("Select countries:", options=data["Country"].unique(), default=["USA", "USSR"])
+countries = st.sidebar.multiselect("Select countries:", options=country_list, default=["USA", "USSR"])
 year_range = st.sidebar.slider("Select year range:", int(data["Year"].min()), int(data["Year"].max()), (1960, 1980))
 
-# Add "All" option to category filter
-category_options = ["All"] + sorted(data["Category"].unique())
-selected_categories = st.sidebar.multiselect("Select Categories:", options=category_options, default=["All"])
+selected_categories = st.sidebar.multiselect("Select Categories:", options=category_list, default=["All"])
 
 # ---- Search Bar ----
 search = st.sidebar.text_input("Search by Test Name")
 
+# ---- Map Options ----
+# Created with the other sidebar widgets so the choice survives switching sections
+use_hexagons = st.sidebar.checkbox("Use aggregation (HexagonLayer)")
+
 # ---- Filtering ----
-if "All" in selected_categories:
-    filtered_data = data[(data["Country"].isin(countries)) &
-                         (data["Year"].between(year_range[0], year_range[1]))]
-else:
-    filtered_data = data[(data["Country"].isin(countries)) &
-                         (data["Year"].between(year_range[0], year_range[1])) &
-                         (data["Category"].isin(selected_categories))]
+def category_mask(col, values):
+    # Boolean lookup table indexed by category code, so the mask is a single gather.
+    # The extra trailing slot stays False and catches the -1 code used for missing values.
+    selected = col.cat.categories.get_indexer(list(values))
+    lut = np.zeros(len(col.cat.categories) + 1, dtype=bool)
+    lut[selected[selected >= 0]] = True
+    return lut[col.cat.codes.to_numpy()]
+
+# Modes via bincount over integer codes/years: one counting pass, no hash table or sort
+def mode_cat(series):
+    codes = series.cat.codes.to_numpy()
+    codes = codes[codes >= 0]
+    return series.cat.categories[np.bincount(codes).argmax()]
 
-if search:
-    filtered_data = filtered_data[filtered_data["Test Name"].str.contains(search, case=False, na=False)]
+def mode_year(years):
+    counts = np.bincount(years - years.min())
+    i = counts.argmax()
+    return int(i + years.min()), int(counts[i])
+
+@st.cache_data(max_entries=CACHE_MAX_ENTRIES)
+def compute_filtered(countries: tuple, yr: tuple, cats: tuple, search: str):
+    df, agg, _, _ = load_data()
+
+    # Rows are sorted by year, so the year range is a contiguous slice found by binary search
+    lo_i, hi_i = np.searchsorted(df["Year"].to_numpy(), [yr[0], yr[1] + 1])
+    window = df.iloc[lo_i:hi_i]
+
+    # Build one boolean buffer over the window and AND the other conditions into it in place
+    mask = category_mask(window["Country"], countries)
+    if "All" not in cats:
+        np.logical_and(mask, category_mask(window["Test Type"], cats), out=mask)
+    if search:
+        np.logical_and(mask, window["Test Name"].str.contains(search, case=False, na=False, regex=False).to_numpy(), out=mask)
+    filtered = window.iloc[mask.nonzero()[0]]
+
+    # Identifies the exact rows selected, so filter states that match the same rows share cached output
+    summary = {"count": filtered.shape[0], "row_key": hash(filtered.index.to_numpy().tobytes())}
+    if summary["count"] > 0:
+        if "All" in cats and not search:
+            # Only the country and year filters apply, so slice the pre-aggregated table
+            table = agg["year_x_country"]
+            year_totals = table.loc[table.index.isin(countries), yr[0]:yr[1]].sum(axis=0)
+            top_year, top_year_count = year_totals.idxmax(), year_totals.max()
+        else:
+            top_year, top_year_count = mode_year(filtered["Year"].to_numpy())
+        summary.update(
+            avg_depth=filtered["Depth"].mean(),
+            min_depth=filtered["Depth"].min(),
+            max_depth=filtered["Depth"].max(),
+            avg_lat=filtered["Latitude"].mean(),
+            avg_lon=filtered["Longitude"].mean(),
+            unique_locations=filtered["Location"].nunique(),
+            top_country=mode_cat(filtered["Country"]),
+            top_purpose=mode_cat(filtered["Purpose"]),
+            top_type=mode_cat(filtered["Test Type"]),
+            top_year=top_year,
+            top_year_count=top_year_count,
+        )
+
+    return filtered, summary
+
+filter_sig = (tuple(countries), tuple(year_range), tuple(selected_categories), search)
+filtered_data, summary = compute_filtered(*filter_sig)
 
 # ---- Sidebar Summary ----
-count = filtered_data.shape[0]
+count = summary["count"]
 if count > 0:
-    avg_depth = filtered_data["Depth"].mean()
-    min_depth = filtered_data["Depth"].min()
-    max_depth = filtered_data["Depth"].max()
-    avg_lat = filtered_data["Latitude"].mean()
-    avg_lon = filtered_data["Longitude"].mean()
-    unique_locations = filtered_data["Location"].nunique()
-    top_country = filtered_data["Country"].value_counts().idxmax()
-    top_purpose = filtered_data["Purpose"].value_counts().idxmax()
-    top_type = filtered_data["Test Type"].value_counts().idxmax()
+    avg_depth = summary["avg_depth"]
+    min_depth = summary["min_depth"]
+    max_depth = summary["max_depth"]
+    avg_lat = summary["avg_lat"]
+    avg_lon = summary["avg_lon"]
+    unique_locations = summary["unique_locations"]
+    top_country = summary["top_country"]
+    top_purpose = summary["top_purpose"]
+    top_type = summary["top_type"]
 
     with st.sidebar.expander("Data Summary", expanded=True):
         st.markdown(f"**# of Explosions:** {count}")
@@ -116,6 +260,93 @@ if count > 0:
 else:
     st.warning("No data matches the selected filters.")
 
+# ---- Chart Rendering ----
+def fig_to_png(fig):
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", bbox_inches="tight")
+    plt.close(fig)
+    return buf.getvalue()
+
+# Charts are cached as PNG bytes keyed on row_key, like the map Deck; the leading underscores keep
+# the plotted arrays out of the cache key since row_key already identifies them
+@st.cache_data(max_entries=CACHE_MAX_ENTRIES)
+def make_depth_hist(row_key, _depth_arr, _cat_arr, cat_names):
+    edges = np.histogram_bin_edges(_depth_arr, bins=DEPTH_BINS)
+    widths = np.diff(edges)
+
+    # Bin index per row, then one bincount over (category, bin) pairs gives every stack at once
+    bin_idx = np.digitize(_depth_arr, edges[1:-1])
+    per_cat = np.bincount(_cat_arr.astype(np.intp) * DEPTH_BINS + bin_idx, minlength=len(cat_names) * DEPTH_BINS)
+    per_cat = per_cat.reshape(len(cat_names), DEPTH_BINS)
+
+    fig, ax = plt.subplots(figsize=(6, 4))
+    bottom = np.zeros(DEPTH_BINS)
+    for name, row in zip(cat_names, per_cat):
+        if row.any():
+            ax.bar(edges[:-1], row, width=widths, bottom=bottom, align="edge", alpha=0.75, label=name)
+            bottom += row
+
+    # A KDE only adds information once there are enough points to smooth
+    if len(_depth_arr) > KDE_MIN_POINTS and np.ptp(_depth_arr) > 0:
+        xs = np.linspace(edges[0], edges[-1], 200)
+        ax.plot(xs, gaussian_kde(_depth_arr)(xs) * len(_depth_arr) * widths[0], color="black")
+
+    ax.set_xlabel("Depth")
+    ax.set_ylabel("Count")
+    ax.legend(title="Category")
+    return fig_to_png(fig)
+
+@st.cache_data(max_entries=CACHE_MAX_ENTRIES)
+def make_year_bar(row_key, _year_arr):
+    fig, ax = plt.subplots(figsize=(6, 4))
+    pd.Series(_year_arr).value_counts().sort_index().plot(kind='bar', ax=ax)
+    ax.set_xlabel("Year")
+    ax.set_ylabel("# of Explosions")
+    return fig_to_png(fig)
+
+# ---- Map Rendering ----
+# The Deck is reused across reruns that select the same rows; the leading underscore keeps the
+# DataFrame out of the cache key since row_key already identifies it
+@st.cache_resource(max_entries=CACHE_MAX_ENTRIES)
+def build_deck(row_key, use_hexagons, lat, lon, _data):
+    if use_hexagons:
+        # Hexagon bins summarise every point into a few cells, so no sampling is needed
+        layer = pdk.Layer(
+            "HexagonLayer",
+            data=_data[["Longitude", "Latitude"]],
+            get_position='[Longitude, Latitude]',
+            radius=50000,
+            extruded=True,
+            pickable=True,
+        )
+        tooltip = HEXAGON_TOOLTIP
+    else:
+        # Large point sets slow pydeck down badly, so only draw a fixed-size sample
+        map_df = _data[MAP_COLUMNS]
+        if len(map_df) > MAP_POINT_LIMIT:
+            map_df = map_df.sample(MAP_POINT_LIMIT, random_state=0)
+        layer = pdk.Layer(
+            "ScatterplotLayer",
+            data=map_df,
+            get_position='[Longitude, Latitude]',
+            get_color='[200, 30, 0, 160]',
+            get_radius=50000,
+            pickable=True,
+        )
+        tooltip = SCATTER_TOOLTIP
+
+    return pdk.Deck(
+        map_style="mapbox://styles/mapbox/light-v9",
+        initial_view_state=pdk.ViewState(
+            latitude=lat,
+            longitude=lon,
+            zoom=2,
+            pitch=40 if use_hexagons else 0,
+        ),
+        layers=[layer],
+        tooltip=tooltip
+    )
+
 # ---- Section Handling ----
 if section == "Overview":
     st.header("Overview")
@@ -128,9 +359,7 @@ if section == "Overview":
         with col2:
             st.metric(label="Shallowest Explosion (m)", value=f"{min_depth:.2f}")
         with col3:
-            top_year = filtered_data["Year"].value_counts().idxmax()
-            top_year_count = filtered_data["Year"].value_counts().max()
-            st.metric(label=f"Peak Year ({top_year})", value=f"{top_year_count} tests")
+            st.metric(label=f"Peak Year ({summary['top_year']})", value=f"{summary['top_year_count']} tests")
 
 elif section == "Charts":
     if count > 1:
@@ -140,17 +369,16 @@ elif section == "Charts":
 
         with col1:
             st.markdown("**About this chart:**\n\nThis histogram shows how deep each nuclear explosion occurred. It helps us understand testing patterns across test categories and countries.")
-            fig1, ax1 = plt.subplots(figsize=(6, 4))
-            sns.histplot(data=filtered_data, x="Depth", hue="Category", kde=True, ax=ax1)
-            st.pyplot(fig1)
+            st.image(make_depth_hist(
+                summary["row_key"],
+                filtered_data["Depth"].to_numpy(),
+                filtered_data["Test Type"].cat.codes.to_numpy(),
+                tuple(filtered_data["Test Type"].cat.categories),
+            ), use_container_width=True)
 
         with col2:
             st.markdown("**About this chart:**\n\nThis bar chart displays the number of nuclear tests conducted per year in the filtered range. It helps identify peak testing periods.")
-            fig2, ax2 = plt.subplots(figsize=(6, 4))
-            filtered_data["Year"].value_counts().sort_index().plot(kind='bar', ax=ax2)
-            ax2.set_xlabel("Year")
-            ax2.set_ylabel("# of Explosions")
-            st.pyplot(fig2)
+            st.image(make_year_bar(summary["row_key"], filtered_data["Year"].to_numpy()), use_container_width=True)
     else:
         st.warning("Not enough data to generate charts. Try adjusting your filters.")
 
@@ -158,26 +386,10 @@ elif section == "Map":
     if count > 0:
         st.header("Explosion Locations")
         st.markdown("This interactive map displays the geographical distribution of nuclear test sites. Each dot represents a test explosion site.")
-        st.pydeck_chart(pdk.Deck(
-            map_style="mapbox://styles/mapbox/light-v9",
-            initial_view_state=pdk.ViewState(
-                latitude=filtered_data["Latitude"].mean(),
-                longitude=filtered_data["Longitude"].mean(),
-                zoom=2,
-                pitch=0,
-            ),
-            layers=[
-                pdk.Layer(
-                    "ScatterplotLayer",
-                    data=filtered_data,
-                    get_position='[Longitude, Latitude]',
-                    get_color='[200, 30, 0, 160]',
-                    get_radius=50000,
-                    pickable=True,
-                )
-            ],
-            tooltip={"text": "{Country}\n{Location}\nYear: {Year}\nDepth: {Depth}\nCategory: {Category}"}
-        ))
+
+        if not use_hexagons and len(filtered_data) > MAP_POINT_LIMIT:
+            st.caption(f"Showing a random sample of {MAP_POINT_LIMIT} of {len(filtered_data)} explosions.")
+        st.pydeck_chart(build_deck(summary["row_key"], use_hexagons, avg_lat, avg_lon, filtered_data))
     else:
         st.warning("No map data to display.")
 
@@ -185,11 +397,18 @@ elif section == "Details":
     if count > 0:
         st.header("Top 5 Deepest Explosions")
         st.markdown("This table shows the five deepest nuclear explosions based on filtered data.")
-        st.dataframe(filtered_data.nlargest(5, "Depth")[["Country", "Location", "Year", "Depth", "Category"]])
+        # Partial partition finds the k deepest in O(n); only those k rows get sorted. Restoring row
+        # order before a stable sort keeps tied depths in table order, as nlargest does, though which
+        # rows tied at the k-th depth make the cut is still up to the partition
+        depth = filtered_data["Depth"].to_numpy()
+        k = min(5, len(depth))
+        idx = np.sort(np.argpartition(-depth, k - 1)[:k])
+        top = filtered_data.iloc[idx].sort_values("Depth", ascending=False, kind="stable")
+        st.dataframe(top[["Country", "Location", "Year", "Depth", "Test Type"]])
 
         st.subheader("Explosion Test Details")
         st.markdown("A preview of key details for up to 10 nuclear tests matching your current filters.")
-        st.dataframe(filtered_data[["Test Name", "Test Type", "Purpose", "Country", "Year", "Category"]].head(10))
+        st.dataframe(filtered_data[["Test Name", "Test Type", "Purpose", "Country", "Year"]].head(10))
     else:
         st.warning("No test details available for selected filters.")
 